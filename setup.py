@@ -34,7 +34,8 @@ setup(
     zip_safe=False,
     keywords='ultra_config',
     extras_require={
-        'aws': ['boto3']
+        'aws': ['boto3'],
+        'fast': ['orjson']
     },
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',
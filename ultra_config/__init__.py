@@ -10,16 +10,13 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from collections import OrderedDict
 from functools import wraps
-
-try:
-    from configparser import ConfigParser
-except ImportError:
-    from ConfigParser import ConfigParser
 import json
+import os
 
 from insensitive_dict import CaseInsensitiveDict
-from env_config import get_envvar_configuration
+from env_config import get_envvar_configuration  # noqa: F401 kept for backwards compatibility
 
 from ultra_config.secrets import decrypt
 
@@ -27,6 +24,48 @@ __author__ = 'Tim Martin'
 __email__ = 'tim@timmartin.me'
 __version__ = '0.6.3'
 
+_INI_DEFAULT_SECTION = 'DEFAULT'
+
+# The fastest available json parser, imported the
+# first time a json file is loaded with ``fast=True``
+_fast_json_loads = None
+# Whether ``_fast_json_loads`` can parse a buffer such as a memoryview
+_fast_json_loads_accepts_buffers = False
+# Json files larger than this are memory mapped rather than read
+_MMAP_THRESHOLD = 64 * 1024
+
+# The raw and json decoded environment variables keyed by prefix
+_ENV_CACHE = {}
+
+
+def clear_env_cache():
+    """
+    Clears the cache of json decoded environment variables.
+    The cache is automatically bypassed whenever the matching
+    environment variables change so this is mostly useful
+    for testing.
+    """
+    _ENV_CACHE.clear()
+
+
+def _get_fast_json_loads():
+    """
+    Imports the fastest available json ``loads``
+    function the first time it is needed
+    """
+    global _fast_json_loads, _fast_json_loads_accepts_buffers
+    if _fast_json_loads is None:
+        try:
+            from orjson import loads
+            _fast_json_loads_accepts_buffers = True
+        except ImportError:
+            try:
+                from ujson import loads
+            except ImportError:
+                loads = json.loads
+        _fast_json_loads = loads
+    return _fast_json_loads
+
 
 def load_python_module_settings(module, ignore_prefix='_'):
     """
@@ -47,11 +86,8 @@ def load_python_module_settings(module, ignore_prefix='_'):
     :return: The items from the module as a dictionary
     :rtype: dict
     """
-    items = {}
-    for key, value in module.__dict__.items():
-        if not (key.startswith(ignore_prefix)):
-            items[key] = value
-    return items
+    return {key: value for key, value in vars(module).items()
+            if not key.startswith(ignore_prefix)}
 
 
 def load_python_object_settings(obj, ignore_prefix='_'):
@@ -77,15 +113,20 @@ def load_python_object_settings(obj, ignore_prefix='_'):
     return load_python_module_settings(obj, ignore_prefix=ignore_prefix)
 
 
-def load_dict_settings(dictionary):
+def load_dict_settings(dictionary, copy_dict=True):
     """
     A simple wrapper that just copies the dictionary
 
     :param dict dictionary:
+    :param bool copy_dict: Whether to copy the dictionary.  It can
+        be skipped when the result is only read, e.g. by
+        ``UltraConfig.load`` which copies the items anyway
     :return: A configuration dictionary
     :rtype: dict
     """
-    return dictionary.copy()
+    if not copy_dict:
+        return dictionary
+    return dict(dictionary)
 
 
 def load_configparser_settings(filename):
@@ -94,6 +135,15 @@ def load_configparser_settings(filename):
     It returns a dictionary of dictionaries with
     each section getting its own dictionary
 
+    The file is parsed line by line rather than with
+    ``ConfigParser`` which is significantly faster.  Option
+    names are lowercased and values from the ``[DEFAULT]``
+    section are merged into every other section just like
+    ``ConfigParser``.  However, interpolation and multi-line
+    (continuation) values are not supported.  Lines that are
+    not a section header or a ``key = value`` pair are ignored
+    and a missing file loads as an empty configuration.
+
     :param unicode filename: The name of the file
         to load as configuration
     :return: A dictionary of dictionaries with
@@ -103,16 +153,44 @@ def load_configparser_settings(filename):
     :rtype: dict
     """
     items = {}
-    config_parser = ConfigParser()
-    config_parser.read(filename)
-    for section_key in config_parser.sections():
-        items[section_key] = {}
-        for option_key in config_parser.options(section_key):
-            items[section_key][option_key] = config_parser.get(section_key, option_key)
+    try:
+        with open(filename, mode='r') as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError):
+        return items
+
+    section = None
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped[0] in ';#':
+            continue
+        if stripped[0] == '[':
+            # Like ConfigParser the header runs up to the last ']'
+            # so that anything after it, e.g. a comment, is ignored
+            end = stripped.rfind(']')
+            if end > 1:
+                section = items.setdefault(stripped[1:end], {})
+                continue
+        if section is None:
+            continue
+        # Split on whichever of the delimiters comes first
+        key, delimiter, value = stripped.partition('=')
+        if ':' in key:
+            key, delimiter, value = stripped.partition(':')
+        key = key.rstrip()
+        if delimiter and key:
+            section[key.lower()] = value.lstrip()
+
+    defaults = items.pop(_INI_DEFAULT_SECTION, None)
+    if defaults:
+        for section_key, section_items in items.items():
+            merged = defaults.copy()
+            merged.update(section_items)
+            items[section_key] = merged
     return items
 
 
-def load_json_file_settings(filename):
+def load_json_file_settings(filename, fast=False):
     """
     Loads a json file as configuration
     The json file should contain a JSON
@@ -121,12 +199,102 @@ def load_json_file_settings(filename):
 
     :param unicode filename: The name of
         the json file to load
+    :param bool fast: Parse the file with ``orjson`` or ``ujson``
+        if either is installed (``pip install ultra_config[fast]``).
+        They are much faster than the standard library but are
+        stricter: ``NaN`` and ``Infinity`` are rejected and integers
+        that don't fit in 64 bits lose precision or are rejected
     :return: A dictionary of the values from
         the json file
     :rtype: dict
     """
-    with open(filename, mode='r') as f:
-        return json.load(f)
+    # Unbuffered since the file is read in one go
+    with open(filename, mode='rb', buffering=0) as f:
+        if not fast:
+            return json.loads(f.read().decode('utf-8'))
+        json_loads = _get_fast_json_loads()
+        if _fast_json_loads_accepts_buffers and os.fstat(f.fileno()).st_size > _MMAP_THRESHOLD:
+            # Parse straight from the page cache instead of copying the file
+            import mmap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    return json_loads(view)
+        return json_loads(f.read())
+
+
+def load_envvar_settings(app_name, load_as_json=True):
+    """
+    Loads the environment variables that start with
+    the uppercased ``app_name`` followed by an ``'_'``
+    as configuration.  The prefix is stripped from the keys.
+
+    .. code-block:: python
+
+        # MYAPP_DEBUG=true
+        config = load_envvar_settings('myapp')
+        assert config['DEBUG'] is True
+
+    :param unicode app_name: The name of the application
+    :param bool load_as_json: Indicates whether the values should
+        be read as json.  Values that are not valid json are
+        left as the raw string
+    :return: A configuration dictionary
+    :rtype: dict
+    """
+    prefix = '{0}_'.format(app_name.upper())
+    prefix_length = len(prefix)
+    raw_config = {key[prefix_length:]: value for key, value in os.environ.items()
+                  if key.startswith(prefix)}
+    if not load_as_json:
+        return raw_config
+
+    cached = _ENV_CACHE.get(prefix)
+    if cached is not None and cached[0] == raw_config:
+        # Nothing changed, only the mutable values need to be fresh copies
+        raw_config, config, mutable_keys = cached
+        config = config.copy()
+        for key in mutable_keys:
+            config[key] = json.loads(raw_config[key])
+        return config
+
+    config = raw_config.copy()
+    for key, value in raw_config.items():
+        try:
+            config[key] = json.loads(value)
+        except (ValueError, TypeError):
+            pass
+    mutable_keys = [key for key, value in config.items() if isinstance(value, (dict, list))]
+    _ENV_CACHE[prefix] = (raw_config, config.copy(), mutable_keys)
+    return config
+
+
+def _memoize(func, maxsize=256):
+    """
+    Caches the results of a single argument function for
+    the ``maxsize`` most recently used arguments.  Unhashable
+    arguments are passed straight through to the function.
+    """
+    cache = OrderedDict()
+
+    # Not wrapped with functools.wraps, on python 2 it fails for
+    # callables without a __name__ such as functools.partial
+    def memoized(value):
+        """Wrapper for the actual function"""
+        try:
+            result = cache[value]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable
+            return func(value)
+        else:
+            # Re-inserted since OrderedDict.move_to_end is python 3 only
+            cache[value] = cache.pop(value)
+            return result
+        result = cache[value] = func(value)
+        if len(cache) > maxsize:
+            cache.popitem(last=False)
+        return result
+    return memoized
 
 
 class MissingConfigurationException(ValueError):
@@ -140,9 +308,14 @@ class UltraConfig(CaseInsensitiveDict):
     """
     A case insensitive dictionary like object
     that allows for loading configuration
-    using a multitude of mechanisms
+    using a multitude of mechanisms.
+
+    The configuration is loaded lazily the first
+    time it is accessed if ``load`` has not been
+    called explicitly.
     """
-    def __init__(self, loaders, required=None, encrypter=None, decrypter=None, secrets_config_key='SECRETS'):
+    def __init__(self, loaders, required=None, encrypter=None, decrypter=None, secrets_config_key='SECRETS',
+                 cache_decrypter=False):
         """
         :param list loaders: A list of configuration loaders
             Each loader should be a tuple with three items
@@ -161,13 +334,26 @@ class UltraConfig(CaseInsensitiveDict):
         :param unicode secrets_config_key: The configuration value which
             indicates all of the configuration parameters that are encrypted.
             The value of this key should be a list of strings
+        :param bool cache_decrypter: Remember the result of the ``decrypter``
+            for recently decrypted values so that decrypting the same value
+            again (e.g. via ``get_encrypted``) doesn't call it.  Only use it
+            if the same encrypted value always decrypts to the same result
         """
         self.required = required or []
+        self._loaded = False
+        # Incremented on every modification so that
+        # ``GlobalConfig.inject`` knows when it is stale
+        self._mutations = 0
         super(UltraConfig, self).__init__()
-        self._loaders = list(loaders)
+        # Normalized to (function, args, kwargs) so load doesn't have to
+        self._loaders = [(loader[0],
+                          loader[1] if len(loader) > 1 else (),
+                          loader[2] if len(loader) > 2 else {}) for loader in loaders]
         # A map of secret config keys and whether they are currently encrypted
         self.decrypted = False
         self.encrypter = encrypter
+        if cache_decrypter and decrypter is not None:
+            decrypter = _memoize(decrypter)
         self.decrypter = decrypter
         self.secrets_config_key = secrets_config_key
 
@@ -176,12 +362,69 @@ class UltraConfig(CaseInsensitiveDict):
         Loads all of the configuration as specified
         by the ``loaders``
         """
-        for loader in self._loaders:
-            config_loader_func = loader[0]
-            args = loader[1] if len(loader) > 1 else []
-            kwargs = loader[2] if len(loader) > 2 else {}
+        # Merge everything keyed the same way as the underlying
+        # CaseInsensitiveDict storage so that it can be written in bulk
+        merged = {}
+        for config_loader_func, args, kwargs in self._loaders:
             items = config_loader_func(*args, **kwargs)
-            self.update(items)
+            if not hasattr(items, 'items'):
+                # Loaders may return anything ``dict.update`` accepts
+                items = dict(items)
+            merged.update({key.lower(): (key, value) for key, value in items.items()})
+        self._store.update(merged)
+        self._loaded = True
+        self._mutations += 1
+
+    def __getitem__(self, key):
+        if not self._loaded:
+            self.load()
+        return self._store[key.lower()][1]
+
+    def __setitem__(self, key, value):
+        if not self._loaded:
+            self.load()
+        super(UltraConfig, self).__setitem__(key, value)
+        self._mutations += 1
+
+    def __delitem__(self, key):
+        if not self._loaded:
+            self.load()
+        super(UltraConfig, self).__delitem__(key)
+        self._mutations += 1
+
+    def __iter__(self):
+        if not self._loaded:
+            self.load()
+        return super(UltraConfig, self).__iter__()
+
+    def __len__(self):
+        if not self._loaded:
+            self.load()
+        return len(self._store)
+
+    def update(self, *args, **kwargs):
+        """
+        The same as ``dict.update`` except that the items
+        are written to the underlying storage in bulk
+        rather than one ``__setitem__`` at a time.
+        """
+        items = dict(*args, **kwargs)
+        if not items:
+            return
+        if not self._loaded:
+            self.load()
+        self._store.update({key.lower(): (key, value) for key, value in items.items()})
+        self._mutations += 1
+
+    def lower_items(self):
+        if not self._loaded:
+            self.load()
+        return super(UltraConfig, self).lower_items()
+
+    def copy(self):
+        if not self._loaded:
+            self.load()
+        return super(UltraConfig, self).copy()
 
     def validate(self):
         """
@@ -193,13 +436,13 @@ class UltraConfig(CaseInsensitiveDict):
 
         :raises: MissingConfigurationException
         """
-        missing_items = []
-        for item in self.required:
-            if item not in self:
-                missing_items.append(item)
-        if len(missing_items) > 0:
-            required_string = ', '.join(['"{0}"'.format(item) for item in missing_items])
-            raise MissingConfigurationException('Missing required items: {0}'.format(required_string))
+        if not self.required:
+            return
+        if not self._loaded:
+            self.load()
+        missing_items = [item for item in self.required if item.lower() not in self._store]
+        if missing_items:
+            raise MissingConfigurationException('Missing required items: "' + '", "'.join(missing_items) + '"')
 
     def encrypt(self):
         """
@@ -258,13 +501,106 @@ class UltraConfig(CaseInsensitiveDict):
         else:
             return self.decrypter(self[key])
 
+    def __contains__(self, key):
+        if not self._loaded:
+            self.load()
+        return key.lower() in self._store
+
+    def get(self, key, default=None):
+        """
+        Gets the value for ``key`` or ``default`` if it is
+        not set.  This is a single lookup in the underlying
+        storage rather than ``Mapping.get``'s ``try``/``except``
+
+        :param unicode key:
+        :param object default:
+        """
+        if not self._loaded:
+            self.load()
+        item = self._store.get(key.lower())
+        if item is None:
+            return default
+        return item[1]
+
+    def freeze(self):
+        """
+        Optimizes the configuration for reading once it
+        has been loaded.  Lookups skip the indirection of
+        the case insensitive storage.  Modifications are
+        still allowed and are applied to both so freezing
+        never changes the behaviour.
+        """
+        if not self._loaded:
+            self.load()
+        self._flat = {lower_key: value for lower_key, (key, value) in self._store.items()}
+        self.__class__ = _FrozenUltraConfig
+
+    def thaw(self):
+        """
+        Undoes ``freeze``.  It does nothing if the
+        configuration is not frozen
+        """
+
+
+class _FrozenUltraConfig(UltraConfig):
+    """
+    An ``UltraConfig`` that has been frozen for fast reads.
+    ``_store`` is kept as the source of truth and ``_flat``
+    is a plain dictionary of the lowercased keys and values
+    """
+    def __getitem__(self, key):
+        return self._flat[key.lower()]
+
+    def __contains__(self, key):
+        return key.lower() in self._flat
+
+    def get(self, key, default=None):
+        return self._flat.get(key.lower(), default)
+
+    def __setitem__(self, key, value):
+        super(_FrozenUltraConfig, self).__setitem__(key, value)
+        self._flat[key.lower()] = value
+
+    def __delitem__(self, key):
+        super(_FrozenUltraConfig, self).__delitem__(key)
+        del self._flat[key.lower()]
+
+    def update(self, *args, **kwargs):
+        items = dict(*args, **kwargs)
+        if not items:
+            return
+        super(_FrozenUltraConfig, self).update(items)
+        self._flat.update({key.lower(): value for key, value in items.items()})
+
+    def load(self):
+        super(_FrozenUltraConfig, self).load()
+        self._flat = {lower_key: value for lower_key, (key, value) in self._store.items()}
+
+    def freeze(self):
+        pass
+
+    def thaw(self):
+        del self._flat
+        self.__class__ = UltraConfig
+
+
+# The loaders used by simple_config in the order of its arguments
+_SIMPLE_CONFIG_LOADERS = (
+    load_python_module_settings,
+    load_json_file_settings,
+    load_configparser_settings,
+    load_envvar_settings,
+    load_dict_settings,
+)
+
 
 def simple_config(default_settings=None,
                   json_file=None,
                   ini_file=None,
                   env_var_prefix=None,
                   overrides=None,
-                  required=None):
+                  required=None,
+                  json_fast=False):
     """
     Loads configuration in the following order
     * default_settings python module object
@@ -273,7 +609,9 @@ def simple_config(default_settings=None,
     * environment variables starting with env_var_prefix
     * overrides dict
 
-    Configuration from latter ones will override previous ones
+    Configuration from latter ones will override previous ones.
+    Nothing is loaded until the configuration is first accessed
+    unless there are ``required`` items to validate.
 
     :param module default_settings:
     :param unicode json_file:
@@ -281,22 +619,16 @@ def simple_config(default_settings=None,
     :param unicode env_var_prefix:
     :param dict overrides:
     :param list[unicode] required: The required configuration
+    :param bool json_fast: Parse the ``json_file`` with ``orjson``
+        or ``ujson``.  See ``load_json_file_settings``
     :return: UltraConfig
     """
-    loaders = []
-    if default_settings:
-        loaders.append([load_python_module_settings, [default_settings]])
-    if json_file:
-        loaders.append([load_json_file_settings, [json_file]])
-    if ini_file:
-        loaders.append([load_configparser_settings, [ini_file]])
-    if env_var_prefix:
-        loaders.append([get_envvar_configuration, [env_var_prefix]])
-    if overrides:
-        loaders.append([load_dict_settings, [overrides]])
+    sources = (default_settings, json_file, ini_file, env_var_prefix, overrides)
+    loader_kwargs = ({}, {'fast': json_fast}, {}, {}, {'copy_dict': False})
+    loaders = [(loader, (source,), kwargs)
+               for loader, source, kwargs in zip(_SIMPLE_CONFIG_LOADERS, sources, loader_kwargs) if source]
 
     config = UltraConfig(loaders, required=required)
-    config.load()
     config.validate()
     return config
 
@@ -322,7 +654,9 @@ class GlobalConfig(object):
         existing configuration if it's already set.
         Takes the same parameters as ``simple_config``
         """
-        cls.config = simple_config(*args, **kwargs)
+        config = simple_config(*args, **kwargs)
+        config.freeze()
+        cls.config = config
 
     @classmethod
     def inject(cls, *inject_args, **inject_kwargs):
@@ -346,20 +680,99 @@ class GlobalConfig(object):
             myfunc(keyword="don't inject")
             # prints "arg: 1, keyword: don't inject"
 
+        The injected values are looked up on the first call
+        and reused until ``GlobalConfig.config`` is modified
+        or replaced, e.g. by calling ``GlobalConfig.load`` again.
+
         :param inject_args:
         :param inject_kwargs:
         :return:
         """
         def decorator(func):
             """The actual decorator"""
+            # [config, modification count, args, kwargs] of the last resolution
+            resolved = [None, None, (), {}]
+
+            def resolve():
+                """Looks up the injected values unless they are still current"""
+                config = cls.config
+                # Only an UltraConfig counts its modifications, anything else is always looked up
+                mutations = getattr(config, '_mutations', None)
+                if mutations is None or resolved[0] is not config or resolved[1] != mutations:
+                    extra_args = tuple(config[name] for name in inject_args)
+                    extra_kwargs = {}
+                    for key, name in inject_kwargs.items():
+                        try:
+                            extra_kwargs[key] = config[name]
+                        except KeyError:
+                            pass
+                    # Re-read since the lookups may have lazily loaded the configuration
+                    resolved[:] = [config, getattr(config, '_mutations', None), extra_args, extra_kwargs]
+                return resolved[2], resolved[3]
+
+            def add_kwargs(kwargs, extra_kwargs):
+                """Adds the injected keyword arguments that were not passed in"""
+                for key, value in extra_kwargs.items():
+                    if key not in kwargs:
+                        kwargs[key] = value
+                if len(extra_kwargs) < len(inject_kwargs):
+                    # Only fail on missing configuration that was not passed in
+                    for key, value in inject_kwargs.items():
+                        if key not in kwargs:
+                            kwargs[key] = cls.config[value]
+
+            # Only do the work that is actually needed on every call
+            if not inject_args and not inject_kwargs:
+                return func
+
+            if not inject_kwargs:
+                @wraps(func)
+                def args_wrapper(*args, **kwargs):
+                    """Wrapper for actual function"""
+                    return func(*(args + resolve()[0]), **kwargs)
+                return args_wrapper
+
+            if not inject_args:
+                @wraps(func)
+                def kwargs_wrapper(*args, **kwargs):
+                    """Wrapper for actual function"""
+                    add_kwargs(kwargs, resolve()[1])
+                    return func(*args, **kwargs)
+                return kwargs_wrapper
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                """Wrapper for actual function"""
+                extra_args, extra_kwargs = resolve()
+                add_kwargs(kwargs, extra_kwargs)
+                return func(*(args + extra_args), **kwargs)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def inject_eager(cls, *inject_args, **inject_kwargs):
+        """
+        The same as ``inject`` except that the configuration
+        values are looked up once when the function is decorated.
+        The configuration must therefore be loaded before the
+        decorator is applied and later calls to ``GlobalConfig.load``
+        are not reflected in the injected values.
+
+        :param inject_args:
+        :param inject_kwargs:
+        :return:
+        """
+        def decorator(func):
+            """The actual decorator"""
+            extra_args = tuple(cls.config[name] for name in inject_args)
+            extra_kwargs = {key: cls.config[name] for key, name in inject_kwargs.items()}
+
             @wraps(func)
             def wrapper(*args, **kwargs):
                 """Wrapper for actual function"""
-                extra_args = [cls.config[name] for name in inject_args]
-                all_args = list(args) + list(extra_args)
-                for key, value in inject_kwargs.items():
+                for key, value in extra_kwargs.items():
                     if key not in kwargs:
-                        kwargs[key] = cls.config[value]
-                return func(*all_args, **kwargs)
+                        kwargs[key] = value
+                return func(*(args + extra_args), **kwargs)
             return wrapper
         return decorator
@@ -1,9 +1,15 @@
+"""
+Helpers for configuring applications running on AWS.
+``boto3`` is never imported here, the clients are passed
+in by the caller so that importing this module stays cheap.
+"""
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import base64
+import binascii
+from collections import OrderedDict
 import json
 try:
     from json.decoder import JSONDecodeError
@@ -11,8 +17,14 @@ except ImportError:
     JSONDecodeError = ValueError
 import logging
 
+from ultra_config.secrets import _concurrent_map
+
 LOG = logging.getLogger(__name__)
 
+# The characters a json document can start with.  Anything
+# else is a raw string and not worth attempting to parse
+_JSON_LEAD_CHARACTERS = frozenset('{["0123456789-tfnNI \t\n\r')
+
 try:
     unicode_type = unicode
 except NameError:
@@ -38,23 +50,88 @@ def create_kms_decrypter(client, decode=True, **kwargs):
         ``client.decrypt`` function (e.g. GrantToken or EncryptionContext).
     :return: The decrypter function
     """
-    def kms_decrypter(value):
+    # binascii accepts both ascii unicode and bytes so the
+    # only thing that varies between calls is the decoding
+    if decode:
+        def kms_decrypter(value):
+            """
+            A decrypter function to be used with ``ultra_config.secrets:decrypt``
+            that uses AWS KMS as the decryption mechanism
+
+            :param unicode value: The value to decrypt
+            :return: The decrypted value
+            :rtype: unicode
+            """
+            resp = client.decrypt(CiphertextBlob=binascii.a2b_base64(value), **kwargs)
+            return resp['Plaintext'].decode('utf-8')
+    else:
+        def kms_decrypter(value):
+            """
+            A decrypter function to be used with ``ultra_config.secrets:decrypt``
+            that uses AWS KMS as the decryption mechanism
+
+            :param unicode value: The value to decrypt
+            :return: The decrypted value
+            :rtype: bytes
+            """
+            return client.decrypt(CiphertextBlob=binascii.a2b_base64(value), **kwargs)['Plaintext']
+    return kms_decrypter
+
+
+def create_kms_batch_decrypter(client, decode=True, max_workers=16, cache_size=256, **kwargs):
+    """
+    Returns a function that decrypts many values at once
+    using AWS KMS.  KMS has no batch API so the ``client.decrypt``
+    calls are made concurrently from a thread pool.  The plaintext
+    of recently decrypted values is cached so that the same
+    ciphertext is only sent to KMS once.  On python 2 the
+    calls are only concurrent if the ``futures`` backport is
+    installed, otherwise they are made one at a time.
+
+    It requires the AWS IAM permission Allow on ``kms:Decrypt``
+
+    :param client: A kms client e.g. ``boto3.client('kms')``
+    :param bool decode: If True, decode as utf-8 automatically
+    :param int max_workers: The maximum number of concurrent
+        decrypt calls
+    :param int cache_size: The maximum number of decrypted values
+        to keep.  Set to 0 to disable caching
+    :param dict kwargs: Additional arguments to be passed to the
+        ``client.decrypt`` function (e.g. GrantToken or EncryptionContext).
+    :return: A function that takes a list of encrypted values
+        and returns a list of the decrypted values in the same order
+    :rtype: function
+    """
+    decrypter = create_kms_decrypter(client, decode=decode, **kwargs)
+    cache = OrderedDict()
+
+    def kms_batch_decrypter(values):
         """
-        A decrypter function to be used with ``ultra_config.secrets:decrypt``
-        that uses AWS KMS as the decryption mechanism
+        Decrypts all of the values using AWS KMS
 
-        :param unicode value: The value to decrypt
-        :return: The decrypted value
-        :rtype: unicode
+        :param list[unicode] values: The values to decrypt
+        :return: The decrypted values
+        :rtype: list[unicode]
         """
-        if isinstance(value, unicode_type):
-            value = value.encode('utf-8')
-        value = base64.b64decode(value)
-        resp = client.decrypt(CiphertextBlob=value, **kwargs)
-        if decode:
-            return resp['Plaintext'].decode('utf-8')
-        return resp['Plaintext']
-    return kms_decrypter
+        values = list(values)
+        uncached = [value for value in OrderedDict.fromkeys(values) if value not in cache]
+        decrypted = dict(zip(uncached, _concurrent_map(decrypter, uncached, max_workers)))
+
+        results = []
+        for value in values:
+            if value in decrypted:
+                results.append(decrypted[value])
+            else:
+                # Re-inserted since OrderedDict.move_to_end is python 3 only
+                cache[value] = cache.pop(value)
+                results.append(cache[value])
+
+        if cache_size > 0:
+            cache.update(decrypted)
+            while len(cache) > cache_size:
+                cache.popitem(last=False)
+        return results
+    return kms_batch_decrypter
 
 
 def encrypt_kms(client, key_id, value, **kwargs):
@@ -78,7 +155,7 @@ def encrypt_kms(client, key_id, value, **kwargs):
         value = value.encode('utf-8')
     resp = client.encrypt(KeyId=key_id, Plaintext=value, **kwargs)
     encrypted = resp['CiphertextBlob']
-    encrypted = base64.b64encode(encrypted)
+    encrypted = binascii.b2a_base64(encrypted).rstrip(b'\n')
     return encrypted.decode('utf-8')
 
 
@@ -127,19 +204,20 @@ def load_task_definition_settings(data, prefix=None, container=0, load_as_json=T
     """
     env_vars = data[container]['environment']
 
-    config = {}
-    for env_var in env_vars:
-        key = _strip_prefix(env_var['name'], prefix)
-        if not key:
-            continue
+    full_prefix = prefix + '_' if prefix else ''
+    prefix_length = len(full_prefix)
+    config = {env_var['name'][prefix_length:]: env_var['value'] for env_var in env_vars
+              if env_var['name'].startswith(full_prefix) and len(env_var['name']) > prefix_length}
+    if not load_as_json:
+        return config
 
-        if load_as_json:
-            try:
-                config[key] = json.loads(env_var['value'])
-            except JSONDecodeError:  # raw strings
-                config[key] = env_var['value']
-        else:
-            config[key] = env_var['value']
+    for key, value in config.items():
+        if not value or value[0] not in _JSON_LEAD_CHARACTERS:
+            continue
+        try:
+            config[key] = json.loads(value)
+        except JSONDecodeError:  # raw strings
+            pass
     return config
 
 
@@ -177,20 +255,13 @@ def dump_task_definition_settings(config, task_definition, prefix=None, containe
     env_vars = _convert_to_task_definition_environment(config,
                                                        prefix=prefix,
                                                        dump_as_json=dump_as_json)
-    existing_env = task_definition[container]['environment']
-    existing_env.extend(env_vars)
-
-    existing_keys = set()
-    new_env = []
-    # Grab the newer ones first
-    for env_var in existing_env[::-1]:
-        if env_var['name'].upper() in existing_keys:
-            continue
-        new_env.append(env_var)
-        existing_keys.add(env_var['name'].upper())
+    merged = {}
+    # The newer ones override the existing ones
+    for env_var in task_definition[container]['environment'] + env_vars:
+        merged[env_var['name'].upper()] = env_var
 
     # enforce a consistent order
-    new_env = sorted(new_env, key=lambda envvar: envvar['name'])
+    new_env = sorted(merged.values(), key=lambda envvar: envvar['name'])
     task_definition[container]['environment'] = new_env
     return json.dumps(task_definition, indent=4, sort_keys=True)
 
@@ -206,8 +277,8 @@ def _strip_prefix(key, prefix):
     :return: The prefix-free key
     :rtype: unicode
     """
-    if prefix and key.startswith('%s_' % prefix):
-        return key[len(prefix) + 1:]
-    elif not prefix:
+    if not prefix:
         return key
+    if key.startswith(prefix + '_'):
+        return key[len(prefix) + 1:]
     return None
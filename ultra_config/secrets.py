@@ -7,13 +7,17 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from collections import OrderedDict
 import logging
 import warnings
 
 LOG = logging.getLogger(__name__)
 
+# The formatted missing secrets warnings keyed by secrets_config_key
+_MISSING_SECRETS_WARNINGS = {}
 
-def decrypt(config, decrypter, secrets_config_key='SECRETS', secrets_list=None):
+
+def decrypt(config, decrypter, secrets_config_key='SECRETS', secrets_list=None, parallelism=1):
     """
     Takes a config object and decrypts the values of the keys
     specified in the configuration itself or via the ``secrets_list``
@@ -32,6 +36,12 @@ def decrypt(config, decrypter, secrets_config_key='SECRETS', secrets_list=None):
     you can manually pass in a set of keys via
     ``secrets_list=['API_SECRET', 'DB_PASSWORD']``.
 
+    Decrypters that make network calls (e.g. AWS KMS) can
+    be run concurrently from a thread pool by passing
+    ``parallelism=8``.  The decrypter must be thread safe.
+    On python 2 this needs the ``futures`` backport, without
+    it the values are decrypted one at a time.
+
     :param ultra_config.UltraConfig config: The configuration object
         with the secrets to decrypt
     :param function decrypter: The function that takes an
@@ -41,12 +51,39 @@ def decrypt(config, decrypter, secrets_config_key='SECRETS', secrets_list=None):
         to be decrypted
     :param list[unicode] secrets_list: A list of configuration
         keys the need to be decrypted
+    :param int parallelism: The maximum number of values to
+        decrypt concurrently.
     :rtype: NoneType
     """
     keys = _get_secret_keys(config, secrets_config_key, secrets_list)
 
-    for key in keys:
-        config[key] = decrypter(config.get(key))
+    values = [config.get(key) for key in keys]
+    decrypted = _concurrent_map(decrypter, values, parallelism)
+    config.update(zip(keys, decrypted))
+
+
+def _concurrent_map(func, values, max_workers):
+    """
+    Calls ``func`` with each of the ``values`` from a pool of
+    up to ``max_workers`` threads and returns the results in order.
+    The values are handled one at a time when there is nothing to
+    gain or ``concurrent.futures`` is not available (python 2
+    without the ``futures`` backport)
+
+    :param function func:
+    :param list values:
+    :param int max_workers:
+    :rtype: list
+    """
+    if max_workers > 1 and len(values) > 1:
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError:
+            pass
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(values))) as executor:
+                return list(executor.map(func, values))
+    return [func(value) for value in values]
 
 
 def _get_secret_keys(config, secrets_config_key='SECRETS', secrets_list=None):
@@ -57,12 +94,29 @@ def _get_secret_keys(config, secrets_config_key='SECRETS', secrets_list=None):
     if secrets_config_key is not None:
         configuration_keys = config.get(secrets_config_key)
         if configuration_keys is None:
-            warnings.warn('ultra-config was unable to find any configuration for '
-                          '{0}.  Please set {0}=[] in your configuration or pass '
-                          '`secrets_config_key=None` if you wish to manually set '
-                          'the configuration keys to decrypt'.format(secrets_config_key))
+            warnings.warn(_missing_secrets_warning(secrets_config_key))
             configuration_keys = []
         keys.extend(configuration_keys)
     secrets_list = secrets_list or []
     keys.extend(secrets_list)
-    return keys
+    # A key listed twice, in any case, must not be decrypted twice
+    unique_keys = OrderedDict()
+    for key in keys:
+        unique_keys.setdefault(key.lower(), key)
+    return list(unique_keys.values())
+
+
+def _missing_secrets_warning(secrets_config_key):
+    """
+    The warning for when the ``secrets_config_key`` is not
+    set in the configuration.  It is only formatted once
+    for each key since it is usually the same on every call
+    """
+    message = _MISSING_SECRETS_WARNINGS.get(secrets_config_key)
+    if message is None:
+        message = ('ultra-config was unable to find any configuration for '
+                   '{0}.  Please set {0}=[] in your configuration or pass '
+                   '`secrets_config_key=None` if you wish to manually set '
+                   'the configuration keys to decrypt'.format(secrets_config_key))
+        _MISSING_SECRETS_WARNINGS[secrets_config_key] = message
+    return message
@@ -5,13 +5,14 @@ from __future__ import unicode_literals
 
 import base64
 import json
+import sys
 import unittest
 
-from mock import Mock
+from mock import Mock, patch
 
 from ultra_config.extensions.aws import create_kms_decrypter, encrypt_kms, \
     _strip_prefix, load_task_definition_settings, dump_task_definition_settings, \
-    _convert_to_task_definition_environment, create_kms_encrypter
+    _convert_to_task_definition_environment, create_kms_encrypter, create_kms_batch_decrypter
 
 
 class TestKMSDecryption(unittest.TestCase):
@@ -40,6 +41,40 @@ class TestKMSDecryption(unittest.TestCase):
         self.assertEqual(self.value.decode('utf-8'), resp)
 
 
+class TestKMSBatchDecryption(unittest.TestCase):
+    def setUp(self):
+        self.client = Mock(decrypt=Mock(side_effect=lambda CiphertextBlob: {'Plaintext': CiphertextBlob[::-1]}))
+        self.values = [base64.b64encode(value).decode('utf-8') for value in [b'abc', b'def', b'abc']]
+
+    def test_ensure_order_preserved(self):
+        decrypter = create_kms_batch_decrypter(self.client)
+        resp = decrypter(self.values)
+        self.assertListEqual(['cba', 'fed', 'cba'], resp)
+
+    def test_when_not_decode(self):
+        decrypter = create_kms_batch_decrypter(self.client, decode=False)
+        resp = decrypter(self.values)
+        self.assertListEqual([b'cba', b'fed', b'cba'], resp)
+
+    def test_when_cached__decrypt_once(self):
+        decrypter = create_kms_batch_decrypter(self.client)
+        decrypter(self.values)
+        decrypter(self.values)
+        self.assertEqual(2, self.client.decrypt.call_count)
+
+    def test_when_cache_disabled__decrypt_every_call(self):
+        decrypter = create_kms_batch_decrypter(self.client, cache_size=0)
+        decrypter(self.values)
+        decrypter(self.values)
+        self.assertEqual(4, self.client.decrypt.call_count)
+
+    def test_when_no_concurrent_futures__decrypt_sequentially(self):
+        decrypter = create_kms_batch_decrypter(self.client)
+        with patch.dict(sys.modules, {'concurrent.futures': None}):
+            resp = decrypter(self.values)
+        self.assertListEqual(['cba', 'fed', 'cba'], resp)
+
+
 class TestEncryptKMS(unittest.TestCase):
     def setUp(self):
         self.value = 'blah'
@@ -71,6 +106,20 @@ class TestLoadTaskDefinitionSettings(unittest.TestCase):
         resp = load_task_definition_settings(td)
         self.assertEqual(1, resp['blah'])
 
+    def test_when_load_as_json__raw_strings_kept(self):
+        td = [{'environment': [{'name': 'a', 'value': 'blah'}, {'name': 'b', 'value': 'true-ish'},
+                               {'name': 'c', 'value': ''}, {'name': 'd', 'value': '{"x": [1]}'}]}]
+        resp = load_task_definition_settings(td)
+        self.assertDictEqual({'a': 'blah', 'b': 'true-ish', 'c': '', 'd': {'x': [1]}}, resp)
+
+    def test_when_load_as_json__same_as_standard_library(self):
+        td = [{'environment': [{'name': 'big', 'value': '123456789012345678901234567890'},
+                               {'name': 'nan', 'value': 'NaN'}, {'name': 'inf', 'value': '-Infinity'}]}]
+        resp = load_task_definition_settings(td)
+        self.assertEqual(123456789012345678901234567890, resp['big'])
+        self.assertNotEqual(resp['nan'], resp['nan'])
+        self.assertEqual(float('-inf'), resp['inf'])
+
     def test_when_not_load_as_json__dont_load_json(self):
         td = [{'environment': [{'name': 'b', 'value': '1'}]}]
         resp = load_task_definition_settings(td, load_as_json=False)
@@ -3,9 +3,12 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import sys
 import unittest
 import warnings
 
+from mock import Mock, patch
+
 from ultra_config import UltraConfig
 from ultra_config.secrets import decrypt
 
@@ -51,4 +54,33 @@ class TestDecrypt(unittest.TestCase):
         decrypt(config, lambda value: 'blah', secrets_config_key=None, secrets_list=['SUPER_SECRET'])
         self.assertEqual(config['SUPER_SECRET'], 'blah')
 
+    def test__when_key_listed_twice__decrypt_once(self):
+        config = UltraConfig([])
+        config['SUPER_SECRET'] = 'a'
+        config['SECRETS'] = ['SUPER_SECRET']
+        decrypt(config, lambda value: value + 'a', secrets_list=['SUPER_SECRET'])
+        self.assertEqual(config['SUPER_SECRET'], 'aa')
+
+    def test__when_key_listed_twice_in_different_case__decrypt_once(self):
+        config = UltraConfig([])
+        config['DB_PASS'] = 'a'
+        config['SECRETS'] = ['db_pass']
+        decrypter = Mock(side_effect=lambda value: value + 'a')
+        decrypt(config, decrypter, secrets_list=['DB_PASS', 'Db_Pass'])
+        self.assertEqual('aa', config['DB_PASS'])
+        self.assertEqual(1, decrypter.call_count)
+
+    def test__when_parallel__decrypt_all(self):
+        config = UltraConfig([])
+        config['SECRETS'] = ['A', 'B', 'C']
+        config.update(A='a', B='b', C='c')
+        decrypt(config, lambda value: value.upper(), parallelism=2)
+        self.assertEqual(['A', 'B', 'C'], [config['A'], config['B'], config['C']])
 
+    def test__when_parallel_and_no_concurrent_futures__decrypt_sequentially(self):
+        config = UltraConfig([])
+        config['SECRETS'] = ['A', 'B']
+        config.update(A='a', B='b')
+        with patch.dict(sys.modules, {'concurrent.futures': None}):
+            decrypt(config, lambda value: value.upper(), parallelism=2)
+        self.assertEqual(['A', 'B'], [config['A'], config['B']])
@@ -3,12 +3,18 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import functools
+import json
 import os
+import shutil
+import tempfile
 import unittest
 
+from mock import Mock, patch
+
 from ultra_config import simple_config, load_json_file_settings, \
     load_configparser_settings, load_python_object_settings, load_dict_settings, \
-    UltraConfig
+    UltraConfig, GlobalConfig, load_envvar_settings, clear_env_cache
 from ultra_config_tests.unit_tests import default_config
 
 
@@ -33,6 +39,26 @@ class TestSimpleConfig(unittest.TestCase):
         self.assertEqual(2, config['ENV_VAR_OVERRIDE'])
         self.assertEqual(2, config['OVERRIDE'])
 
+    def test_loaded_on_first_access(self):
+        with patch.object(UltraConfig, 'load', autospec=True, side_effect=UltraConfig.load) as load:
+            config = simple_config(overrides=dict(X=1))
+            self.assertFalse(load.called)
+            self.assertEqual(1, config['x'])
+            self.assertEqual(1, load.call_count)
+
+    def test_when_required__loaded_immediately(self):
+        with patch.object(UltraConfig, 'load', autospec=True, side_effect=UltraConfig.load) as load:
+            simple_config(overrides=dict(X=1), required=['x'])
+            self.assertTrue(load.called)
+
+    def test_when_json_fast__fast_parser_used(self):
+        json_filename = os.path.join(os.path.dirname(__file__), '..', 'settings', 'json_settings.json')
+        with patch('ultra_config._get_fast_json_loads', return_value=json.loads) as get_fast_json_loads:
+            self.assertEqual(1, simple_config(json_file=json_filename)['JSON_1'])
+            self.assertFalse(get_fast_json_loads.called)
+            self.assertEqual(1, simple_config(json_file=json_filename, json_fast=True)['JSON_1'])
+            self.assertTrue(get_fast_json_loads.called)
+
 
 class TestLoadJSONFileSettings(unittest.TestCase):
     def setUp(self):
@@ -43,6 +69,50 @@ class TestLoadJSONFileSettings(unittest.TestCase):
         self.assertEqual(1, config['JSON_1'])
         self.assertEqual(2, config['json_2'])
 
+    def test_when_fast(self):
+        config = load_json_file_settings(self.filename, fast=True)
+        self.assertEqual(1, config['JSON_1'])
+        self.assertEqual(2, config['json_2'])
+
+    def test_when_fast_and_large_file__loaded(self):
+        config = self.load_temporary('{"x": [%s]}' % ', '.join(['1'] * 100000), fast=True)
+        self.assertEqual(100000, len(config['x']))
+
+    def test_when_large_file_through_simple_config__memory_mapped(self):
+        loaded_types = []
+
+        def buffer_loads(data):
+            loaded_types.append(type(data))
+            return json.loads(bytes(data).decode('utf-8'))
+
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'settings.json')
+            with open(filename, mode='w') as f:
+                f.write('{"x": [%s]}' % ', '.join(['1'] * 100000))
+            with patch('ultra_config._get_fast_json_loads', return_value=buffer_loads), \
+                    patch('ultra_config._fast_json_loads_accepts_buffers', True):
+                config = simple_config(json_file=filename, json_fast=True)
+                self.assertEqual(100000, len(config['x']))
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual([memoryview], loaded_types)
+
+    def test_when_not_fast__standard_library_behaviour(self):
+        config = self.load_temporary('{"big": 123456789012345678901234567890, "nan": NaN}')
+        self.assertEqual(123456789012345678901234567890, config['big'])
+        self.assertNotEqual(config['nan'], config['nan'])
+
+    def load_temporary(self, content, **kwargs):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'settings.json')
+            with open(filename, mode='w') as f:
+                f.write(content)
+            return load_json_file_settings(filename, **kwargs)
+        finally:
+            shutil.rmtree(directory)
+
 
 class TestLoadConfigParserSettings(unittest.TestCase):
     def setUp(self):
@@ -56,6 +126,86 @@ class TestLoadConfigParserSettings(unittest.TestCase):
         self.assertEqual('2', config['ini']['y'])
         self.assertEqual('3', config['ini2']['z'])
 
+    def test_when_file_missing__empty(self):
+        config = load_configparser_settings(os.path.join(self.filename, 'missing.ini'))
+        self.assertDictEqual({}, config)
+
+
+class TestLoadConfigParserSettingsParsing(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'settings.ini')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self, content):
+        with open(self.filename, mode='w') as f:
+            f.write(content)
+        return load_configparser_settings(self.filename)
+
+    def test_comments_and_blank_lines_ignored(self):
+        config = self.load('; comment\n\n[section]\n# another = 1\nkey = value\n')
+        self.assertDictEqual({'section': {'key': 'value'}}, config)
+
+    def test_option_names_lowercased(self):
+        config = self.load('[Section]\nMY_KEY: some value  \n')
+        self.assertDictEqual({'Section': {'my_key': 'some value'}}, config)
+
+    def test_first_delimiter_used(self):
+        config = self.load('[section]\na: b = c\nd = e: f\n= ignored\nignored\n')
+        self.assertDictEqual({'section': {'a': 'b = c', 'd': 'e: f'}}, config)
+
+    def test_default_section_merged(self):
+        config = self.load('[DEFAULT]\nx = 1\ny = 1\n\n[section]\ny = 2\n')
+        self.assertDictEqual({'section': {'x': '1', 'y': '2'}}, config)
+
+    def test_when_comment_after_section__section_used(self):
+        config = self.load('[a]\nx = 1\n[b] ; comment\ny = 2\n')
+        self.assertDictEqual({'a': {'x': '1'}, 'b': {'y': '2'}}, config)
+
+
+class TestLoadEnvvarSettings(unittest.TestCase):
+    def setUp(self):
+        self.environ = {'MYAPP_BOOL': 'false', 'MYAPP_STRING': 'blah', 'NOTMYAPP_X': '1'}
+
+    def test_when_load_as_json__load_json_values(self):
+        with patch.dict(os.environ, self.environ):
+            config = load_envvar_settings('myapp')
+        self.assertDictEqual({'BOOL': False, 'STRING': 'blah'}, config)
+
+    def test_when_not_load_as_json__raw_values(self):
+        with patch.dict(os.environ, self.environ):
+            config = load_envvar_settings('myapp', load_as_json=False)
+        self.assertDictEqual({'BOOL': 'false', 'STRING': 'blah'}, config)
+
+    def test_when_cached__mutable_values_copied(self):
+        clear_env_cache()
+        with patch.dict(os.environ, {'MYAPP_LIST': '[1]'}):
+            load_envvar_settings('myapp')['LIST'].append(2)
+            self.assertDictEqual({'LIST': [1]}, load_envvar_settings('myapp'))
+
+    def test_when_environment_changed__reloaded(self):
+        clear_env_cache()
+        with patch.dict(os.environ, {'MYAPP_X': '1'}):
+            load_envvar_settings('myapp')
+            os.environ['MYAPP_X'] = '2'
+            self.assertDictEqual({'X': 2}, load_envvar_settings('myapp'))
+
+    def test_when_prefix_not_ascii__still_loaded(self):
+        with patch.dict(os.environ, {'\u00c9APP_X': '1'}):
+            config = load_envvar_settings('\u00e9app')
+        self.assertDictEqual({'X': 1}, config)
+
+    def test_when_not_plain_json__same_as_standard_library(self):
+        clear_env_cache()
+        environ = {'MYAPP_BIG': '123456789012345678901234567890', 'MYAPP_NAN': 'NaN', 'MYAPP_INF': '-Infinity'}
+        with patch.dict(os.environ, environ):
+            config = load_envvar_settings('myapp')
+        self.assertEqual(123456789012345678901234567890, config['BIG'])
+        self.assertNotEqual(config['NAN'], config['NAN'])
+        self.assertEqual(float('-inf'), config['INF'])
+
 
 class TestLoadPythonObjects(unittest.TestCase):
     def test_simple(self):
@@ -67,6 +217,15 @@ class TestLoadPythonObjects(unittest.TestCase):
         self.assertEqual(1, config['x'])
         self.assertEqual(2, config['y'])
 
+    def test_when_ignore_prefix_tuple__all_ignored(self):
+        class SomeObj(object):
+            _a = 1
+            Xb = 2
+            c = 3
+
+        config = load_python_object_settings(SomeObj, ignore_prefix=('_', 'X'))
+        self.assertDictEqual({'c': 3}, config)
+
     def test_dict_simple(self):
         original = dict(x=1, y=2)
         config = load_dict_settings(original)
@@ -74,6 +233,16 @@ class TestLoadPythonObjects(unittest.TestCase):
         self.assertEqual(2, config['y'])
         self.assertIsNot(original, config)
 
+    def test_dict_when_mapping__plain_dict(self):
+        config = load_dict_settings(UltraConfig([[lambda: dict(x=1)]]))
+        self.assertIs(dict, type(config))
+        self.assertDictEqual({'x': 1}, config)
+
+    def test_dict_when_not_copy__same_dict(self):
+        original = dict(x=1, y=2)
+        config = load_dict_settings(original, copy_dict=False)
+        self.assertIs(original, config)
+
 
 class TestUltraConfig(unittest.TestCase):
     def setUp(self):
@@ -85,16 +254,62 @@ class TestUltraConfig(unittest.TestCase):
         self.assertEqual(config['x'], 3)
         self.assertEqual(config['y'], 2)
 
+    def test_load__when_keys_differ_in_case__latter_overrides(self):
+        config = UltraConfig([[lambda: dict(X=1)], [lambda: dict(x=2)], [lambda: dict(X=3)]])
+        config.load()
+        config['y'] = 1
+        config.load()
+        self.assertEqual(config['x'], 3)
+        self.assertListEqual(['X', 'y'], list(config))
+
+    def test_load__when_accessed__loaded_lazily(self):
+        calls = []
+        config = UltraConfig([[lambda: calls.append(1) or dict(x=1)]])
+        self.assertListEqual([], calls)
+        self.assertEqual(1, config['X'])
+        self.assertEqual(1, config.get('x'))
+        self.assertListEqual([1], calls)
+
+    def test_load__when_loader_returns_pairs(self):
+        config = UltraConfig([[lambda: [('A', 1)]], [lambda: dict(b=2)]])
+        config.load()
+        self.assertEqual(1, config['a'])
+        self.assertEqual(2, config['B'])
+
+    def test_load__when_set_before_access__set_value_kept(self):
+        config = UltraConfig([[lambda: dict(x=1)]])
+        config['x'] = 2
+        self.assertEqual(2, config['x'])
+
     def test_required_items__when_missing__raises_ValueError(self):
         config = UltraConfig([], required=['required'])
         self.assertRaises(ValueError, config.validate)
 
+    def test_required_items__when_missing__message_lists_items(self):
+        config = UltraConfig([], required=['a', 'b', 'c'])
+        config['B'] = True
+        with self.assertRaises(ValueError) as context:
+            config.validate()
+        self.assertEqual('Missing required items: "a", "c"', str(context.exception))
+
     def test_required_items__when_found(self):
         config = UltraConfig([], required=['required'])
         config['REQUIRED'] = True
         resp = config.validate()
         self.assertIsNone(resp)
 
+    def test_required_items__when_reassigned__validates_new_items(self):
+        config = UltraConfig([], required=['required'])
+        config['REQUIRED'] = True
+        config.required = ['required', 'other']
+        self.assertRaises(ValueError, config.validate)
+
+    def test_required_items__when_appended__validates_new_items(self):
+        config = UltraConfig([], required=['required'])
+        config['REQUIRED'] = True
+        config.required.append('other')
+        self.assertRaises(ValueError, config.validate)
+
     def test_encrypt__when_already_encrypted__raise_value_error(self):
         config = UltraConfig([])
         config.decrypted = False
@@ -149,9 +364,179 @@ class TestUltraConfig(unittest.TestCase):
         resp = config.get_encrypted('blah')
         self.assertEqual('blah', resp)
 
+    def test_get_and_contains__case_insensitive(self):
+        config = UltraConfig([])
+        config['Blah'] = None
+        self.assertIn('BLAH', config)
+        self.assertNotIn('other', config)
+        self.assertIsNone(config.get('blah', 1))
+        self.assertEqual(1, config.get('other', 1))
+
+    def test_update(self):
+        config = UltraConfig([[lambda: dict(X=1)]])
+        config.update([('Y', 2)], z=3)
+        config.update({'x': 4})
+        self.assertDictEqual({'x': 4, 'Y': 2, 'z': 3}, dict(config))
+
+    def test_freeze(self):
+        config = UltraConfig([[lambda: dict(X=1)]])
+        config.load()
+        config.freeze()
+        self.assertEqual(1, config['x'])
+        self.assertEqual(1, config.get('X'))
+        self.assertIsNone(config.get('y'))
+        self.assertIn('x', config)
+        self.assertNotIn('y', config)
+        self.assertIsInstance(config, UltraConfig)
+
+    def test_freeze__when_modified__still_frozen(self):
+        config = UltraConfig([[lambda: dict(X=1)]])
+        config.load()
+        config.freeze()
+        config['Y'] = 2
+        config.update(Z=3)
+        del config['x']
+        self.assertIsNot(UltraConfig, type(config))
+        self.assertDictEqual({'Y': 2, 'Z': 3}, dict(config))
+        self.assertEqual(2, config['y'])
+        self.assertEqual(3, config.get('z'))
+        self.assertNotIn('x', config)
+        config.load()
+        self.assertEqual(1, config['x'])
+
+    def test_freeze__when_decrypted_without_secrets__still_frozen(self):
+        config = UltraConfig([[lambda: dict(X=1, SECRETS=[])]], decrypter=Mock())
+        config.load()
+        config.freeze()
+        config.decrypt()
+        self.assertIsNot(UltraConfig, type(config))
+        self.assertEqual(1, config['x'])
+
+    def test_thaw(self):
+        config = UltraConfig([[lambda: dict(X=1)]])
+        config.freeze()
+        config.thaw()
+        self.assertIs(UltraConfig, type(config))
+        self.assertEqual(1, config['x'])
+
+    def test_get_encrypted__when_cache_decrypter__decrypt_once(self):
+        decrypter = Mock(return_value='blah')
+        config = UltraConfig([], decrypter=decrypter, cache_decrypter=True)
+        config['blah'] = 'something'
+        config['other'] = ['unhashable']
+        self.assertEqual('blah', config.get_encrypted('blah'))
+        self.assertEqual('blah', config.get_encrypted('blah'))
+        self.assertEqual('blah', config.get_encrypted('other'))
+        self.assertEqual(2, decrypter.call_count)
+
+    def test_get_encrypted__when_cache_decrypter_is_partial(self):
+        decrypter = functools.partial('{0}{1}'.format, 'decrypted-')
+        config = UltraConfig([], decrypter=decrypter, cache_decrypter=True)
+        config['blah'] = 'something'
+        self.assertEqual('decrypted-something', config.get_encrypted('blah'))
+
+    def test_get_encrypted__when_not_cache_decrypter__decrypt_every_time(self):
+        decrypter = Mock(return_value='blah')
+        config = UltraConfig([], decrypter=decrypter)
+        config['blah'] = 'something'
+        config.get_encrypted('blah')
+        config.get_encrypted('blah')
+        self.assertEqual(2, decrypter.call_count)
+
     def test_get_encrypted__when_not_encrypted__return(self):
         config = UltraConfig([], decrypter=self.encrypter)
         config.decrypted = True
         config['blah'] = 'something'
         resp = config.get_encrypted('blah')
         self.assertEqual('something', resp)
+
+
+class TestGlobalConfig(unittest.TestCase):
+    def setUp(self):
+        GlobalConfig.load(overrides=dict(SETTING1=1, SETTING2=2))
+
+    def tearDown(self):
+        GlobalConfig.config = {}
+
+    def test_inject(self):
+        @GlobalConfig.inject('SETTING1', keyword='SETTING2')
+        def func(arg, keyword=None):
+            return arg, keyword
+
+        self.assertEqual((1, 2), func())
+        self.assertEqual((1, 3), func(keyword=3))
+
+    def test_inject__when_reloaded__use_new_configuration(self):
+        @GlobalConfig.inject('SETTING1', keyword='SETTING2')
+        def func(arg, keyword=None):
+            return arg, keyword
+
+        func()
+        GlobalConfig.load(overrides=dict(SETTING1=3, SETTING2=4))
+        self.assertEqual((3, 4), func())
+        GlobalConfig.config = dict(SETTING1=5, SETTING2=6)
+        self.assertEqual((5, 6), func())
+
+    def test_inject__when_modified__use_new_values(self):
+        @GlobalConfig.inject('SETTING1', keyword='SETTING2')
+        def func(arg, keyword=None):
+            return arg, keyword
+
+        func()
+        GlobalConfig.config['SETTING1'] = 3
+        self.assertEqual((3, 2), func())
+        GlobalConfig.config.update(SETTING2=4)
+        self.assertEqual((3, 4), func())
+        del GlobalConfig.config['SETTING2']
+        self.assertRaises(KeyError, func)
+        GlobalConfig.config = dict(SETTING1=5, SETTING2=6)
+        func()
+        GlobalConfig.config['SETTING1'] = 7
+        self.assertEqual((7, 6), func())
+
+    def test_inject__when_missing_keyword_passed__no_error(self):
+        @GlobalConfig.inject(keyword='MISSING')
+        def func(keyword=None):
+            return keyword
+
+        self.assertEqual(1, func(keyword=1))
+        self.assertRaises(KeyError, func)
+
+    def test_inject__case_insensitive(self):
+        @GlobalConfig.inject('setting1', keyword='Setting2')
+        def func(arg, keyword=None):
+            return arg, keyword
+
+        self.assertEqual((1, 2), func())
+
+    def test_inject__when_only_args(self):
+        @GlobalConfig.inject('SETTING1', 'SETTING2')
+        def func(*args):
+            return args
+
+        self.assertEqual((0, 1, 2), func(0))
+
+    def test_inject__when_only_kwargs(self):
+        @GlobalConfig.inject(keyword='SETTING2')
+        def func(arg, keyword=None):
+            return arg, keyword
+
+        self.assertEqual((0, 2), func(0))
+
+    def test_inject__when_nothing_injected__return_original(self):
+        def func():
+            pass
+
+        self.assertIs(func, GlobalConfig.inject()(func))
+
+    def test_load__config_frozen(self):
+        self.assertIsNotNone(getattr(GlobalConfig.config, '_flat', None))
+
+    def test_inject_eager(self):
+        @GlobalConfig.inject_eager('SETTING1', keyword='SETTING2')
+        def func(arg, keyword=None):
+            return arg, keyword
+
+        GlobalConfig.load(overrides=dict(SETTING1=3, SETTING2=4))
+        self.assertEqual((1, 2), func())
+        self.assertEqual((1, 3), func(keyword=3))